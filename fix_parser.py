@@ -0,0 +1,26 @@
+import re
+
+# Part of the fix cache key; bump whenever parsing changes so stale cached sections are not reused
+PARSER_VERSION = "3"
+
+# A fenced fix ends at its first closing fence, so any prose or second block after it is ignored;
+# an unfenced fix runs up to the Explanation header (or the end of the reply). An opening fence
+# with no closing one (a truncated reply) is not a fix, so it is retried rather than cached.
+SECTION_RE = re.compile(
+    r"(?:\*\*Root Cause:\*\*\s*(?P<root>.*?)\s*)?"
+    r"\*\*Fixed Code:\*\*\s*"
+    r"(?:```[^\n]*\n(?P<code>.*?)```|(?!\s*```)(?P<bare>.*?)(?=\*\*Explanation:\*\*|\Z))"
+    r"(?:.*?\*\*Explanation:\*\*\s*(?P<expl>.*))?",
+    re.DOTALL,
+)
+
+
+def parse_fix_sections(ai_response):
+    """Split the AI response into its three sections in one regex pass."""
+    match = SECTION_RE.search(ai_response)
+    sections = match.groupdict() if match else {}
+    return {
+        "Root Cause": (sections.get("root") or "").strip() or "Not Found",
+        "Fixed Code": (sections.get("code") or sections.get("bare") or "").strip() or "Not Found",
+        "Explanation": (sections.get("expl") or "").strip() or "Not Found",
+    }
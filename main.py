@@ -1,47 +1,107 @@
 import streamlit as st
-import requests
-import base64
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+import httpx
+import orjson
+import threading
+import collections
+import hashlib
+import tempfile
+import time
 import os
 import re
 from dotenv import load_dotenv
 from groq import Groq
 from fpdf import FPDF
-from functools import lru_cache
+from diskcache import Cache
+from concurrent.futures import ThreadPoolExecutor
+from fix_parser import PARSER_VERSION, parse_fix_sections
 import difflib
 
-load_dotenv()
-GITHUB_TOKEN = os.getenv("GITHUB_PAT")
-GROQ_API_KEY = os.getenv("GROQ_API_KEY")
-ANOTHER_LLM_API_KEY = os.getenv("ANOTHER_LLM_API_KEY")  
+@st.cache_resource
+def load_api_keys():
+    """Read .env once per process instead of on every rerun."""
+    load_dotenv()
+    return os.getenv("GITHUB_PAT"), os.getenv("GROQ_API_KEY"), os.getenv("ANOTHER_LLM_API_KEY")
+
+GITHUB_TOKEN, GROQ_API_KEY, ANOTHER_LLM_API_KEY = load_api_keys()
 
 if not GITHUB_TOKEN:
+    load_api_keys.clear()  # pick up the fixed .env on the next rerun
     st.error("❌ GitHub API Token not found. Set 'GITHUB_PAT' in your .env' file.")
     st.stop()
 if not GROQ_API_KEY:
+    load_api_keys.clear()
     st.error("❌ Groq API Key not found. Set 'GROQ_API_KEY' in your .env' file.")
     st.stop()
 if not ANOTHER_LLM_API_KEY:
+    load_api_keys.clear()
     st.error("❌ Another LLM API Key not found. Set 'ANOTHER_LLM_API_KEY' in your .env' file.")
     st.stop()
 
-client = Groq(api_key=GROQ_API_KEY)
-llm_client = Groq(api_key=ANOTHER_LLM_API_KEY) 
+@st.cache_resource
+def get_groq(api_key):
+    """One Groq client per key, so its connection pool is reused across reruns."""
+    return Groq(api_key=api_key)
+
+@st.cache_resource
+def gh_http():
+    """HTTP/2 client for GitHub calls; requests share one multiplexed connection across reruns."""
+    return httpx.Client(http2=True, headers={"Authorization": f"token {GITHUB_TOKEN}"}, timeout=10)
+
+llm_client = get_groq(ANOTHER_LLM_API_KEY)
+
+
+class GitHubRequestError(Exception):
+    """A GitHub call failed. Raised inside cached fetchers so Streamlit doesn't cache the failure."""
 
 
-def extract_file_path(issue_body, repo_files):
+FILE_PATH_PATTERN = re.compile(r"([\w./-]+\.(?:py|cpp|js|c|java|txt))\b")
+BLOB_URL_PREFIX = re.compile(r"^.*?/blob/[^/]+/")
+
+
+def build_repo_index(repo_files):
+    """Precompute lookup tables over the repo tree so matching a path is a dict hit, not a scan."""
+    return {
+        "paths": set(repo_files),
+        "basenames": {os.path.basename(f): f for f in repo_files},
+        "normalized": {f.lower().strip(): f for f in repo_files},
+    }
+
+
+def match_file_path_in_body(issue_body, repo_index):
+    """Single regex pass over the issue body for paths that exist in the repo."""
+    for match in FILE_PATH_PATTERN.finditer(issue_body):
+        candidate = match.group(1)
+        if candidate in repo_index["paths"]:
+            return candidate
+        basename = os.path.basename(candidate)
+        if basename in repo_index["basenames"]:
+            return repo_index["basenames"][basename]
+    return None
+
+
+PATH_EXTRACTION_PROMPT = (
+    "You are an AI that extracts file paths from GitHub issue descriptions. "
+    "Your task is to find and return the exact GitHub file path or relative file path mentioned. "
+    "Return only the path part, like 'src/main.py' or 'test/CMakeLists.txt'. If none found, reply 'not there'."
+)
+
+
+def extract_file_path(issue_body, repo_index):
     """Extracts file path from GitHub issue body. Supports absolute URL or relative path."""
     try:
-        
+        if not repo_index["paths"]:
+            return None
+
+        # Paths quoted verbatim in the issue don't need an LLM round-trip
+        file_path = match_file_path_in_body(issue_body, repo_index)
+        if file_path:
+            print(f"[✅ Direct Path Match] {file_path}")
+            return file_path
+
         response = llm_client.chat.completions.create(
             messages=[
-                {
-                    "role": "system",
-                    "content": (
-                        "You are an AI that extracts file paths from GitHub issue descriptions. "
-                        "Your task is to find and return the exact GitHub file path or relative file path mentioned. "
-                        "Return only the path part, like 'src/main.py' or 'test/CMakeLists.txt'. If none found, reply 'not there'."
-                    )
-                },
+                {"role": "system", "content": PATH_EXTRACTION_PROMPT},
                 {
                     "role": "user",
                     "content": f"Extract file path (absolute or relative) from:\n\n{issue_body}"
@@ -53,46 +113,43 @@ def extract_file_path(issue_body, repo_files):
         extracted_text = response.choices[0].message.content.strip()
         print(f"[LLM Output] {extracted_text}")
 
-        if not extracted_text or not repo_files:
+        if not extracted_text:
             return None
 
+        normalized_repo_files = repo_index["normalized"]
+
         github_url_match = re.search(
             r"https://github\.com/[^/]+/[^/]+/blob/[^/]+/([^\s`'\"#)>\]]+)", extracted_text
         )
         if github_url_match:
-            file_path = github_url_match.group(1).strip()
-            normalized_file_path = file_path.lower().strip()
-            normalized_repo_files = [f.lower().strip() for f in repo_files]
+            normalized_file_path = github_url_match.group(1).lower().strip()
 
             if normalized_file_path in normalized_repo_files:
-                print(f"[✅ Absolute Path Match] {file_path}")
-                return file_path
+                print(f"[✅ Absolute Path Match] {normalized_repo_files[normalized_file_path]}")
+                return normalized_repo_files[normalized_file_path]
 
             
             close_matches = difflib.get_close_matches(
-                normalized_file_path, normalized_repo_files, n=1, cutoff=0.6
+                normalized_file_path, normalized_repo_files.keys(), n=1, cutoff=0.6
             )
             if close_matches:
-                best_match_index = normalized_repo_files.index(close_matches[0])
-                print(f"[🔍 Fuzzy Absolute Match] {repo_files[best_match_index]}")
-                return repo_files[best_match_index]
+                print(f"[🔍 Fuzzy Absolute Match] {normalized_repo_files[close_matches[0]]}")
+                return normalized_repo_files[close_matches[0]]
 
        
         relative_path_candidate = extracted_text.strip()
         normalized_candidate = relative_path_candidate.lower()
-        normalized_repo_files = [f.lower().strip() for f in repo_files]
 
         if normalized_candidate in normalized_repo_files:
-            print(f"[✅ Relative Path Match] {relative_path_candidate}")
-            return relative_path_candidate
+            print(f"[✅ Relative Path Match] {normalized_repo_files[normalized_candidate]}")
+            return normalized_repo_files[normalized_candidate]
 
         close_matches = difflib.get_close_matches(
-            normalized_candidate, normalized_repo_files, n=1, cutoff=0.6
+            normalized_candidate, normalized_repo_files.keys(), n=1, cutoff=0.6
         )
         if close_matches:
-            best_match_index = normalized_repo_files.index(close_matches[0])
-            print(f"[🔍 Fuzzy Relative Match] {repo_files[best_match_index]}")
-            return repo_files[best_match_index]
+            print(f"[🔍 Fuzzy Relative Match] {normalized_repo_files[close_matches[0]]}")
+            return normalized_repo_files[close_matches[0]]
 
         print(f"[❌ No Match] '{relative_path_candidate}' not found in repo.")
         return None
@@ -103,19 +160,6 @@ def extract_file_path(issue_body, repo_files):
 
 
 
-load_dotenv()
-GITHUB_TOKEN = os.getenv("GITHUB_PAT")
-GROQ_API_KEY = os.getenv("GROQ_API_KEY")
-
-if not GITHUB_TOKEN:
-    st.error("❌ GitHub API Token not found. Set 'GITHUB_PAT' in your .env' file.")
-    st.stop()
-if not GROQ_API_KEY:
-    st.error("❌ Groq API Key not found. Set 'GROQ_API_KEY' in your .env' file.")
-    st.stop()
-
-client = Groq(api_key=GROQ_API_KEY)
-
 st.set_page_config(page_title="Code-Doctor: AI GitHub Bug Fixer", page_icon="🐙", layout="wide")
 
 st.markdown("<h1 style='text-align: center; color:#1D3557;'>Code-Doctor: AI-powered Bug Fixer</h1>", unsafe_allow_html=True)
@@ -130,12 +174,44 @@ def extract_repo_details(github_url):
     parts = github_url.rstrip("/").split("/")
     return (parts[-2], parts[-1]) if len(parts) >= 2 else (None, None)
 
+def github_get_json(url):
+    """GET a GitHub API URL, revalidating with the last ETag so unchanged data costs no rate limit.
+
+    Returns a (status_code, body) pair; a 304 is reported as 200 with the stored body,
+    and body is None for any other non-200 status.
+    """
+    headers = {}
+    etag_key = f"etag:{url}"
+    stored = st.session_state.get(etag_key)
+    if stored:
+        headers["If-None-Match"] = stored["etag"]
+
+    try:
+        response = gh_http().get(url, headers=headers)
+    except httpx.HTTPError as e:
+        print("GitHub Error:", repr(e))
+        raise GitHubRequestError(f"request to {url} failed: {e!r}") from e
+    if response.status_code == 304 and stored:
+        return 200, stored["body"]
+
+    if response.status_code != 200:
+        # Error bodies aren't always JSON (e.g. GitHub's HTML 502/503 pages)
+        print("GitHub Error:", response.status_code, response.text)
+        return response.status_code, None
+
+    # GitHub payloads (the recursive tree especially) can be large; orjson decodes them several times faster
+    body = orjson.loads(response.content)
+    if "ETag" in response.headers:
+        st.session_state[etag_key] = {"etag": response.headers["ETag"], "body": body}
+    return response.status_code, body
+
 def fetch_github_issues(owner, repo):
-    """Fetches open issues from GitHub."""
-    url = f"https://api.github.com/repos/{owner}/{repo}/issues"
-    headers = {"Authorization": f"token {GITHUB_TOKEN}"}
-    response = requests.get(url, headers=headers)
-    return response.json() if response.status_code == 200 else []
+    """Fetches open issues from GitHub, up to 100 in one page; pull requests are dropped."""
+    url = f"https://api.github.com/repos/{owner}/{repo}/issues?state=open&per_page=100"
+    status_code, body = github_get_json(url)
+    if status_code != 200:
+        raise GitHubRequestError(f"issues request returned {status_code}")
+    return [issue for issue in body if "pull_request" not in issue]
 
 # def fetch_repo_files(owner, repo, branch):
 #     """Fetch all source files from the repo, ignoring directories."""
@@ -146,19 +222,15 @@ def fetch_github_issues(owner, repo):
 #     return [file["path"] for file in response.json().get("tree", []) if "path" in file and file["type"] == "blob"] if response.status_code == 200 else []
 
 
-import requests
-
 def fetch_repo_files(owner, repo, branch):
     """Fetch all source files from the repo, handling pagination properly."""
     url = f"https://api.github.com/repos/{owner}/{repo}/git/trees/{branch}?recursive=1"
-    headers = {"Authorization": f"token {GITHUB_TOKEN}"}
-    response = requests.get(url, headers=headers)
+    status_code, body = github_get_json(url)
 
-    if response.status_code != 200:
-        print("Error:", response.status_code, response.json())
-        return []
+    if status_code != 200:
+        raise GitHubRequestError(f"tree request returned {status_code}")
 
-    tree = response.json().get("tree", [])
+    tree = body.get("tree", [])
     
     # Debugging: Check if test/CMakeLists.txt is present
     for file in tree:
@@ -169,178 +241,559 @@ def fetch_repo_files(owner, repo, branch):
 
 
 
-@lru_cache(maxsize=10)
+@st.cache_data(ttl=300)
 def fetch_github_issues_cached(owner, repo):
     """Fetch issues with caching to prevent redundant API calls."""
     return fetch_github_issues(owner, repo)
 
-@lru_cache(maxsize=10)
+@st.cache_data(ttl=300)
 def fetch_repo_files_cached(owner, repo, branch):
     """Fetch repo files with caching."""
     return fetch_repo_files(owner, repo, branch)
 
 
+SEARCH_RATE_LIMIT = 10  # GitHub's /search/code allows 10 requests per minute
+MAX_SEARCHES_PER_ISSUE = 2  # tracebacks quote many frames; the tree resolves the rest in one request
+MAX_SEARCHES_PER_RUN = 5
+
+class SearchBudgetExhausted(GitHubRequestError):
+    """Raised instead of waiting when the per-minute code search budget is used up."""
+
+
+@st.cache_resource
+def get_search_limiter():
+    """Timestamps of recent code searches, shared by every session since they all use one token."""
+    return threading.Lock(), collections.deque()
+
+def take_search_slot():
+    """Claim one code search from this minute's budget; False (without waiting) if none is left."""
+    lock, recent = get_search_limiter()
+    with lock:
+        now = time.monotonic()
+        while recent and now - recent[0] >= 60:
+            recent.popleft()
+        if len(recent) >= SEARCH_RATE_LIMIT:
+            return False
+        recent.append(now)
+        return True
+
+@st.cache_data(ttl=300, show_spinner=False)
+def search_repo_file(owner, repo, name):
+    """Find paths of files called `name` in the repo using GitHub code search."""
+    if not take_search_slot():
+        raise SearchBudgetExhausted("code search rate limit reached")
+    try:
+        response = gh_http().get(
+            "https://api.github.com/search/code",
+            params={"q": f"repo:{owner}/{repo} filename:{name}"},
+        )
+    except httpx.HTTPError as e:
+        print("Search Error:", repr(e))
+        raise GitHubRequestError(f"code search failed: {e!r}") from e
+    if response.status_code != 200:
+        print("Search Error:", response.status_code, response.text)
+        raise GitHubRequestError(f"code search returned {response.status_code}")
+    return [item["path"] for item in orjson.loads(response.content).get("items", []) if os.path.basename(item["path"]) == name]
 
-def fetch_buggy_code(owner, repo, file_path, branch):
-    """Fetch buggy file content from GitHub using the extracted full file path."""
-    if not file_path:
-        return None
-
-    url = f"https://api.github.com/repos/{owner}/{repo}/contents/{file_path}?ref={branch}"
-    headers = {"Authorization": f"token {GITHUB_TOKEN}"}
-    response = requests.get(url, headers=headers)
-    response_data = response.json()
+def candidate_paths(issue_body):
+    """Repo-relative paths quoted in the issue body (plain or as blob URLs), in order of appearance."""
+    for match in FILE_PATH_PATTERN.finditer(issue_body):
+        yield BLOB_URL_PREFIX.sub("", match.group(1)).removeprefix("./").lstrip("/")
 
-    if isinstance(response_data, dict) and "content" in response_data:
+def github_graphql(query, variables):
+    """POST a GraphQL query to GitHub and return its `data`; raises GitHubRequestError on failure."""
+    try:
+        response = gh_http().post("https://api.github.com/graphql", json={"query": query, "variables": variables})
+    except httpx.HTTPError as e:
+        print("GraphQL Error:", repr(e))
+        raise GitHubRequestError(f"GraphQL request failed: {e!r}") from e
+    if response.status_code != 200:
+        print("GraphQL Error:", response.status_code, response.text)
+        raise GitHubRequestError(f"GraphQL request returned {response.status_code}")
+    payload = orjson.loads(response.content)
+    if payload.get("errors"):
+        print("GraphQL Error:", payload["errors"])
+    if not payload.get("data"):
+        raise GitHubRequestError("GraphQL request returned no data")
+    return payload["data"]
+
+GRAPHQL_BATCH_SIZE = 20  # paths per query, so a batch of large files stays well inside the timeout
+
+
+def fetch_blobs(owner, repo, branch, paths, fields):
+    """Look up many `branch:path` objects with one aliased GraphQL query per GRAPHQL_BATCH_SIZE paths.
+
+    Returns the selected Blob `fields` for each path, in order; None where the path is not a file.
+    """
+    blobs = []
+    for offset in range(0, len(paths), GRAPHQL_BATCH_SIZE):
+        blobs.extend(fetch_blob_batch(owner, repo, branch, paths[offset:offset + GRAPHQL_BATCH_SIZE], fields))
+    return blobs
+
+def fetch_blob_batch(owner, repo, branch, paths, fields):
+    """One GraphQL request for `paths`, one alias per path."""
+    declarations = "".join(f", $e{i}: String!" for i in range(len(paths)))
+    aliases = " ".join(f"f{i}: object(expression: $e{i}) {{ ... on Blob {{ {fields} }} }}" for i in range(len(paths)))
+    query = f"query($owner: String!, $name: String!{declarations}) {{ repository(owner: $owner, name: $name) {{ {aliases} }} }}"
+    variables = {"owner": owner, "name": repo, **{f"e{i}": f"{branch}:{path}" for i, path in enumerate(paths)}}
+    repository = github_graphql(query, variables).get("repository") or {}
+    # Non-blob objects (directories) come back as empty dicts
+    return [repository.get(f"f{i}") or None for i in range(len(paths))]
+
+@st.cache_data(ttl=300, show_spinner=False)
+def find_existing_paths(owner, repo, branch, paths):
+    """Which of `paths` are files on the branch.
+
+    Misses are cached along with hits for the ttl; a failed query raises instead, so it is retried.
+    """
+    blobs = fetch_blobs(owner, repo, branch, list(paths), "oid")
+    return {path for path, blob in zip(paths, blobs) if blob}
+
+def best_search_hit(candidate, paths):
+    """The hit sharing the longest run of trailing path components with `candidate`.
+
+    Works both for partial quoted paths (utils/io.py) and for absolute traceback paths
+    (home/u/proj/pkg/io.py). Returns None when several hits tie, rather than guessing.
+    """
+    candidate_parts = candidate.split("/")
+
+    def shared_suffix(path):
+        path_parts = path.split("/")
+        n = 0
+        while n < min(len(candidate_parts), len(path_parts)) and candidate_parts[-1 - n] == path_parts[-1 - n]:
+            n += 1
+        return n
+
+    scores = {path: shared_suffix(path) for path in paths}
+    best = max(scores.values(), default=0)
+    winners = [path for path, score in scores.items() if score == best]
+    return winners[0] if best and len(winners) == 1 else None
+
+def search_file_path(owner, repo, branch, issue_body, budget):
+    """Resolve a file named in the issue body without downloading the repo tree.
+
+    Spends at most MAX_SEARCHES_PER_ISSUE searches, taken from the run-wide `budget`;
+    the budget drops to zero once GitHub's per-minute limit is reached.
+    """
+    searched = set()
+    for candidate in candidate_paths(issue_body):
+        name = os.path.basename(candidate)
+        if name in searched:
+            continue
+        if len(searched) >= MAX_SEARCHES_PER_ISSUE or budget["searches"] <= 0:
+            break
+        searched.add(name)
+        budget["searches"] -= 1
         try:
-            return base64.b64decode(response_data["content"]).decode("utf-8")
-        except Exception as e:
-            st.error(f"❌ Error decoding file `{file_path}`: {e}")
-            return None
-    elif isinstance(response_data, list):
-        st.error(f"❌ `{file_path}` appears to be a directory, not a file.")
-    else:
-        st.error(f"❌ Failed to fetch `{file_path}`: {response_data.get('message', 'Unknown error')}")
+            paths = search_repo_file(owner, repo, name)
+        except SearchBudgetExhausted:
+            budget["searches"] = 0
+            break
+        except GitHubRequestError:
+            continue  # not cached, so the next run searches again
+        file_path = best_search_hit(candidate, paths)
+        if not file_path:
+            continue
+        # Code search only indexes the default branch, so confirm the hit exists on this one
+        try:
+            if file_path in find_existing_paths(owner, repo, branch, (file_path,)):
+                return file_path
+        except GitHubRequestError:
+            continue
     return None
 
+def locate_file_paths(owner, repo, branch, issues):
+    """Find the referenced file for each issue.
+
+    Quoted paths from every issue are checked on the branch in one GraphQL request, then
+    looked up by name with a few code searches; the full tree is downloaded only when both
+    come up empty, and once fetched it replaces search for the remaining issues.
+    """
+    candidates = [list(dict.fromkeys(candidate_paths(issue["body"]))) for issue in issues]
+    try:
+        existing = find_existing_paths(owner, repo, branch, tuple(dict.fromkeys(p for c in candidates for p in c)))
+    except GitHubRequestError:
+        existing = set()  # fall through to search and the tree walk
+
+    repo_index = None
+    budget = {"searches": MAX_SEARCHES_PER_RUN}
+    file_paths = []
+    for issue, issue_candidates in zip(issues, candidates):
+        file_path = next((path for path in issue_candidates if path in existing), None)
+        if not file_path and repo_index is None:
+            file_path = search_file_path(owner, repo, branch, issue["body"], budget)
+        if not file_path:
+            if repo_index is None:
+                try:
+                    repo_index = build_repo_index(fetch_repo_files_cached(owner, repo, branch))
+                except GitHubRequestError:
+                    repo_index = build_repo_index([])
+            file_path = extract_file_path(issue["body"], repo_index)
+        file_paths.append(file_path)
+    return file_paths
+
+
+
+@st.cache_data(ttl=300, show_spinner=False)
+def fetch_buggy_code_all(owner, repo, file_paths, branch):
+    """Fetch the content of every file path in one GraphQL request, returned in the same order.
+
+    Duplicate paths are fetched once. A failed request raises GitHubRequestError, so it is not cached.
+    """
+    unique_paths = list(dict.fromkeys(path for path in file_paths if path))
+    contents = {}
+    for path, blob in zip(unique_paths, fetch_blobs(owner, repo, branch, unique_paths, "text isTruncated")):
+        if not blob or blob["text"] is None:
+            print(f"[❌ Fetch Error] `{path}` is missing, a directory or binary.")
+            continue
+        if blob["isTruncated"]:
+            print(f"[⚠️ Truncated] `{path}` is too large; GitHub returned partial content.")
+        contents[path] = blob["text"]
+    return [contents.get(path) for path in file_paths]
+
+
+LANGUAGE_MAP = {
+    ".py": "Python", ".cpp": "C++", ".js": "JavaScript",
+    ".c": "C", ".java": "Java", ".txt": "Text",
+}
+FILENAME_LANGUAGE_MAP = {"CMakeLists.txt": "CMake"}
+
+
+def detect_language(file_path):
+    """Language of a file from its name or extension, so the prompt names it instead of the model guessing."""
+    basename = os.path.basename(file_path)
+    if basename in FILENAME_LANGUAGE_MAP:
+        return FILENAME_LANGUAGE_MAP[basename]
+    return LANGUAGE_MAP.get(os.path.splitext(basename)[1].lower(), "Unknown")
+
+
+# Error words match inside identifiers (TypeError, NullPointerException); extensions must end a word
+CODE_RELATED_PATTERN = re.compile(r"error|exception|traceback|\.(?:py|cpp|js|c|java|txt)\b", re.IGNORECASE)
+
 
 def is_code_related(issue_body):
     """Check if the issue references a code file or stack trace."""
-    if not issue_body: 
+    return bool(issue_body) and CODE_RELATED_PATTERN.search(issue_body) is not None
+
+
+def should_fix(issue):
+    """Issues labeled `bug` are trusted as-is; anything else has to look code related."""
+    if not issue.get("body"):
         return False
-    keywords = ["error", "exception", "traceback", ".py", ".cpp", ".js", ".c", ".java", ".txt"]
-    return any(keyword in issue_body.lower() for keyword in keywords)
+    if any(label["name"].lower() == "bug" for label in issue.get("labels", [])):
+        return True
+    return is_code_related(issue["body"])
 
 
 
-def fix_code_with_ai(code_snippet, language, issue_body):
-    """Generates AI-powered bug fixes with clear explanations based on the given GitHub issue."""
+MAX_FIX_WORKERS = 8
+
+
+@st.cache_resource
+def get_fix_executor():
+    """Worker threads outlive reruns, so each keeps its Groq client and warm connections."""
+    return ThreadPoolExecutor(max_workers=MAX_FIX_WORKERS)
+
+@st.cache_resource
+def get_thread_state():
+    """Per-worker storage that has to survive reruns along with the workers."""
+    return threading.local()
+
+_thread_local = get_thread_state()
+
+FIX_MODEL = "llama-3.3-70b-versatile"
+FIX_SYSTEM_PROMPT = (
+    "You are an AI  that fixes code and suggests optimizations and suggest code whenever required. \n"
+    "Strictly follow this format:\n\n"
+    "**Root Cause:** (Clearly explain the issue in one line.)\n\n"
+    "**Fixed Code:** (Provide only the corrected code.)\n\n"
+    "**Explanation:** (Summarize how the fix solves the issue.)"
+)
+# Everything that varies per call (language, issue, code) comes after this, so every request
+# in a burst shares a byte-identical prefix that the provider can reuse.
+FIX_USER_PREFIX = "Fix the code below strictly based on the given GitHub issue. \n\n"
+
+@st.cache_resource
+def get_fix_cache():
+    """Survives reruns and restarts, so an unchanged file is never sent to Groq twice."""
+    return Cache(os.path.join(tempfile.gettempdir(), "codedoc_cache"))
+
+fix_cache = get_fix_cache()
+
+
+def get_thread_client():
+    """Return the Groq client owned by the calling worker thread."""
+    if not hasattr(_thread_local, "client"):
+        _thread_local.client = Groq(api_key=GROQ_API_KEY)
+    return _thread_local.client
+
+
+MAX_SNIPPET_TOKENS = 4000
+SNIPPET_CONTEXT_LINES = 80
+# (pattern, innermost_first): Python tracebacks list the innermost frame last,
+# JS/Java stack traces list it first
+LINE_REFERENCE_PATTERNS = (
+    (re.compile(r'File "(?P<file>[^"]+)", line (?P<line>\d+)'), False),
+    (re.compile(r"(?P<file>[\w./-]+\.\w+):(?P<line>\d+)"), True),
+)
+
+
+def estimate_tokens(text):
+    """Rough token count (~4 characters per token); only used to decide when to trim."""
+    return len(text) // 4
+
+
+def trim_code_snippet(code, file_path, issue_body):
+    """Cut a large file down to the lines around where the issue points.
+
+    Returns (snippet, note); note is empty when the whole file is sent. Files with no usable
+    line reference in the issue are sent whole, since there is nothing to anchor a window on;
+    references past the end of the file (stale traces, same-named files) are ignored.
+    """
+    if estimate_tokens(code) <= MAX_SNIPPET_TOKENS:
+        return code, ""
+
+    lines = code.splitlines()
+    basename = os.path.basename(file_path)
+    center = None
+    for pattern, innermost_first in LINE_REFERENCE_PATTERNS:
+        line_numbers = [
+            int(match["line"])
+            for match in pattern.finditer(issue_body)
+            if os.path.basename(match["file"]) == basename and 1 <= int(match["line"]) <= len(lines)
+        ]
+        if line_numbers:
+            center = (line_numbers[0] if innermost_first else line_numbers[-1]) - 1
+            break
+    if center is None:
+        return code, ""
+
+    start = max(0, center - SNIPPET_CONTEXT_LINES)
+    end = min(len(lines), center + SNIPPET_CONTEXT_LINES)
+    return "\n".join(lines[start:end]), f"context: lines {start + 1}-{end} of {file_path}"
+
+
+def fix_cache_key(code_snippet, language, issue_body, snippet_note=""):
+    """Hash everything that determines the AI response, including the model id."""
+    payload = "\0".join(
+        [PARSER_VERSION, FIX_MODEL, FIX_SYSTEM_PROMPT, FIX_USER_PREFIX, language, issue_body, snippet_note, code_snippet]
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def fix_code_with_ai(code_snippet, language, issue_body, snippet_note="", retries=2, on_token=None):
+    """Generates AI-powered bug fixes with clear explanations based on the given GitHub issue.
+
+    Runs on worker threads, so it only logs and leaves rendering to the caller.
+    `snippet_note` says which part of the file `code_snippet` is, if it was trimmed.
+    When `on_token` is given the completion is streamed and it is called with the text so far.
+    Returns None when no attempt produced a fix.
+    """
+    cache_key = fix_cache_key(code_snippet, language, issue_body, snippet_note)
+    code_heading = f"### Buggy Code ({snippet_note}):" if snippet_note else "### Buggy Code:"
+    cached_sections = fix_cache.get(cache_key)
+    if cached_sections is not None:
+        return cached_sections
+
     try:
-        response = client.chat.completions.create(
-            messages=[
-                {"role": "system", "content": "You are an AI  that fixes code and suggests optimizations and suggest code whenever required. \n"
-                                                  "Strictly follow this format:\n\n"
-                                                  "**Root Cause:** (Clearly explain the issue in one line.)\n\n"
-                                                  "**Fixed Code:** (Provide only the corrected code.)\n\n"
-                                                  "**Explanation:** (Summarize how the fix solves the issue.)"},
-                {"role": "user", "content": f"Fix this {language} code strictly based on the given GitHub issue. \n\n"
-                                              f"### GitHub Issue:\n{issue_body}\n\n"
-                                              f"### Buggy Code:\n```{language}\n{code_snippet}\n```"},
-            ],
-            model="llama-3.3-70b-versatile",
-        )
+        for attempt in range(retries + 1):
+            request = dict(
+                messages=[
+                    {"role": "system", "content": FIX_SYSTEM_PROMPT},
+                    {"role": "user", "content": FIX_USER_PREFIX +
+                                                  f"### Language: {language}\n\n"
+                                                  f"### GitHub Issue:\n{issue_body}\n\n"
+                                                  f"{code_heading}\n```{language}\n{code_snippet}\n```"},
+                ],
+                model=FIX_MODEL,
+            )
 
-        # 🔍 Debug: Print full AI response
-        ai_response = response.choices[0].message.content.strip()
-        # st.write("### 🔍 Raw AI Response:")
-        # st.code(ai_response, language="markdown")
+            if on_token is None:
+                response = get_thread_client().chat.completions.create(**request)
+                ai_response = response.choices[0].message.content.strip()
+            else:
+                chunks = []
+                for chunk in get_thread_client().chat.completions.create(**request, stream=True):
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        chunks.append(chunk.choices[0].delta.content)
+                        on_token("".join(chunks))
+                ai_response = "".join(chunks).strip()
 
-        # Use regex to extract sections
-        root_cause_match = re.search(r"\*\*Root Cause:\*\*\s*(.*?)\n", ai_response, re.DOTALL)
-        fixed_code_match = re.search(r"\*\*Fixed Code:\*\*\s*```(?:\w+)?\n(.*?)```", ai_response, re.DOTALL)
-        explanation_match = re.search(r"\*\*Explanation:\*\*\s*(.*)", ai_response, re.DOTALL)
+            # 🔍 Debug: Print full AI response
+            # st.write("### 🔍 Raw AI Response:")
+            # st.code(ai_response, language="markdown")
 
-        formatted_sections = {
-            "Root Cause": root_cause_match.group(1).strip() if root_cause_match else "Not Found",
-            "Fixed Code": fixed_code_match.group(1).strip() if fixed_code_match else "Not Found",
-            "Explanation": explanation_match.group(1).strip() if explanation_match else "Not Found",
-        }
+            formatted_sections = parse_fix_sections(ai_response)
 
-        # 🔍 Debug: Print extracted sections
-        st.write("### 🛠 Extracted Sections from AI:")
-        st.write(f"**Root Cause:** {formatted_sections['Root Cause']}")
-        st.code(formatted_sections["Fixed Code"], language=language.lower() if language != "Unknown" else "plaintext")
-        st.write(f"**Explanation:** {formatted_sections['Explanation']}")
+            if formatted_sections["Fixed Code"] != "Not Found":
+                fix_cache[cache_key] = formatted_sections
+                return formatted_sections
 
-        # Check if fixed code is missing
-        if formatted_sections["Fixed Code"] == "Not Found":
-            st.warning("⚠️ AI did not generate a fix. Retrying...")
-            return fix_code_with_ai(code_snippet, language, issue_body)  # Retry once
+            print(f"[⚠️ No Fix] AI did not generate a fix (attempt {attempt + 1}/{retries + 1}).")
+            if attempt < retries:
+                time.sleep(2 ** attempt)
 
-        return formatted_sections
+        return None
 
     except Exception as e:  
-        st.error(f"❌ AI Error: {e}")
+        print(f"[❌ AI Error] {e}")
         return None
 
 
+def pdf_safe(text):
+    """FPDF's core fonts are latin-1 only; replace anything else (emoji, CJK) instead of failing."""
+    return text.encode("latin-1", "replace").decode("latin-1")
 
-if st.button("🔍 Fetch & Fix All Issues"):
-    if github_url.strip():
-        owner, repo = extract_repo_details(github_url)
-        
-        if owner and repo:
-            with st.spinner("📡 Fetching GitHub issues..."):
-                issues = fetch_github_issues_cached(owner, repo)
-
-            if issues:
-                repo_files = fetch_repo_files_cached(owner, repo, branch)
-                
-                st.subheader("🐞 Processing GitHub Issues")
-                pdf = FPDF()
-                pdf.add_page()
-                pdf.set_font("Arial", size=12)
+def build_fix_report(report_entries):
+    """Lay out one page per fixed issue, each written with a single multi_cell call."""
+    pdf = FPDF()
+    pdf.set_font("Arial", size=12)
+    for parts in report_entries:
+        pdf.add_page()
+        pdf.multi_cell(0, 10, pdf_safe("\n\n".join(parts)))
+    return pdf.output(dest="S").encode("latin-1")
 
-                filtered_issues = [issue for issue in issues if is_code_related(issue.get("body", ""))]
 
 
+def analyze_repo(owner, repo, branch):
+    """Fetch, locate and fix every code-related issue; raises GitHubRequestError if GitHub fails."""
+    with st.spinner("📡 Fetching GitHub issues..."):
+        issues = fetch_github_issues_cached(owner, repo)
 
-                for idx, issue in enumerate(filtered_issues):
+    filtered_issues = [issue for issue in issues if should_fix(issue)]
+    with st.spinner("🔎 Locating referenced files..."):
+        file_paths = locate_file_paths(owner, repo, branch, filtered_issues)
 
-                    print('start1')
-                    file_path = extract_file_path(issue["body"], repo_files)
-                    
-                    # Extract issue status (open or closed)
-                    issue_status = issue.get("state", "unknown").capitalize()
+    with st.spinner("📥 Fetching referenced files..."):
+        buggy_codes = fetch_buggy_code_all(owner, repo, file_paths, branch)
 
-                    st.markdown(f"### 🔍 Issue {idx+1}: {issue['title']} ({issue_status})")
-                    st.write(issue["body"])
-                    print(idx+1)
-                    print('start2')
-                    # Debugging: Print all repo files
-                    # st.write(f"🔍 Available repo files: {repo_files}")
+    languages = [detect_language(file_path) if file_path else None for file_path in file_paths]
 
-                    # Debugging: Print extracted file path
-                    # if file_path:
-                    #     st.markdown(f"✅ **Matched File:** `{file_path}`")
-                    # else:
-                    #     st.warning(f"⚠️ No matching file found for issue {idx+1}.")
-                    #     continue  # Skip this issue if no file path is found
+    # Groq calls are network-bound, so overlap them and render in issue order afterwards.
+    # Meanwhile each worker streams its completion into its own placeholder.
+    pending = [i for i, buggy_code in enumerate(buggy_codes) if buggy_code]
+    live_previews = {i: st.empty() for i in pending}
+    script_ctx = get_script_run_ctx()
 
-                    if not file_path:
-                        st.warning(f"⚠️ No valid file path found for issue {idx+1}. Skipping to the next issue.")
-                        continue  # Skip to the next issue
+    def generate_fix(i):
+        add_script_run_ctx(threading.current_thread(), script_ctx)
+        issue_body = filtered_issues[i]["body"]
+        snippet, snippet_note = trim_code_snippet(buggy_codes[i], file_paths[i], issue_body)
+        preview = live_previews[i]
+        return fix_code_with_ai(
+            snippet, languages[i], issue_body, snippet_note,
+            on_token=lambda text: preview.markdown(f"#### ⏳ Issue {i+1}: {filtered_issues[i]['title']}\n{text}"),
+        )
 
-                    st.markdown(f"✅ **Matched File:** `{file_path}`")
+    with st.spinner("🤖 Generating AI fixes..."):
+        fix_results = get_fix_executor().map(generate_fix, pending)
+        fixes = dict(zip(pending, fix_results))
 
-                    # Fetch buggy code
-                    buggy_code = fetch_buggy_code(owner, repo, file_path, branch)
+    for preview in live_previews.values():
+        preview.empty()
 
-                    # Detect language from file extension
-                    file_extension = os.path.splitext(file_path)[1].lower()
-                    language_map = {
-                        ".py": "Python", ".cpp": "C++", ".js": "JavaScript",
-                        ".c": "C", ".java": "Java", ".txt": "",
-                    }
-                    language = language_map.get(file_extension, "Unknown")
+    return {
+        "issues": filtered_issues,
+        "file_paths": file_paths,
+        "buggy_codes": buggy_codes,
+        "languages": languages,
+        "fixes": fixes,
+        # Runs with a failed file fetch or fix are shown but redone on the next click
+        "complete": all(code for path, code in zip(file_paths, buggy_codes) if path)
+                    and all(fix is not None for fix in fixes.values()),
+    }
 
-                    # Debugging: Print extracted code snippet and language
-                    if buggy_code:
-                        st.markdown(f"### 📝 Extracted Code Snippet")
-                        st.code(buggy_code, language=language.lower() if language != "Unknown" else "plaintext")
-                        st.markdown(f"🌍 **Detected Language:** `{language}`")
 
-                        fix_details = fix_code_with_ai(buggy_code, language, issue["body"])
-                        if fix_details:
-                            st.markdown(f"### 🔍 Root Cause\n{fix_details['Root Cause']}")
-                            st.code(fix_details["Fixed Code"], language=language.lower() if language != "Unknown" else "plaintext")
-                            st.markdown(f"### 📝 Explanation\n{fix_details['Explanation']}")
-                    else:
-                        st.warning(f"⚠️ Failed to retrieve the code from `{file_path}`.")
+results_key = (github_url.strip(), branch)
+saved_results = st.session_state.setdefault("results", {})
 
+if st.button("🔍 Fetch & Fix All Issues"):
+    if github_url.strip():
+        owner, repo = extract_repo_details(github_url)
 
+        # A repeat click for the same repo and branch reuses a complete saved run instead of
+        # re-fetching and re-paying Groq; incomplete runs are redone (cached fixes keep that cheap)
+        saved = saved_results.get(results_key)
+        if owner and repo and not (saved and saved["complete"]):
+            try:
+                run = analyze_repo(owner, repo, branch)
+            except GitHubRequestError as e:
+                st.error(f"❌ GitHub request failed ({e}). Please try again.")
+            else:
+                if run["issues"]:
+                    saved_results[results_key] = run
+                else:
+                    saved_results.pop(results_key, None)
+                    st.info("ℹ️ No open code-related issues found in this repository.")
 
     else:
         st.warning("⚠️ Please enter a GitHub repository link.")
 
+results = saved_results.get(results_key)
+if results and results["issues"]:
+    st.subheader("🐞 Processing GitHub Issues")
+    report_entries = []
+
+    for idx, (issue, file_path, buggy_code) in enumerate(zip(results["issues"], results["file_paths"], results["buggy_codes"])):
+
+        # Extract issue status (open or closed)
+        issue_status = issue.get("state", "unknown").capitalize()
+
+        st.markdown(f"### 🔍 Issue {idx+1}: {issue['title']} ({issue_status})")
+        st.write(issue["body"])
+        # Debugging: Print all repo files
+        # st.write(f"🔍 Available repo files: {repo_files}")
+
+        # Debugging: Print extracted file path
+        # if file_path:
+        #     st.markdown(f"✅ **Matched File:** `{file_path}`")
+        # else:
+        #     st.warning(f"⚠️ No matching file found for issue {idx+1}.")
+        #     continue  # Skip this issue if no file path is found
+
+        if not file_path:
+            st.warning(f"⚠️ No valid file path found for issue {idx+1}. Skipping to the next issue.")
+            continue  # Skip to the next issue
+
+        st.markdown(f"✅ **Matched File:** `{file_path}`")
+
+        language = results["languages"][idx]
+
+        # Debugging: Print extracted code snippet and language
+        if buggy_code:
+            st.markdown(f"### 📝 Extracted Code Snippet")
+            st.code(buggy_code, language=language.lower() if language != "Unknown" else "plaintext")
+            st.markdown(f"🌍 **Detected Language:** `{language}`")
+
+            fix_details = results["fixes"].get(idx)
+            if fix_details:
+                st.markdown(f"### 🔍 Root Cause\n{fix_details['Root Cause']}")
+                st.code(fix_details["Fixed Code"], language=language.lower() if language != "Unknown" else "plaintext")
+                st.markdown(f"### 📝 Explanation\n{fix_details['Explanation']}")
+
+                report_entries.append([
+                    f"Issue {idx+1}: {issue['title']}",
+                    f"File: {file_path}",
+                    f"Root Cause: {fix_details['Root Cause']}",
+                    f"Fixed Code:\n{fix_details['Fixed Code']}",
+                    f"Explanation: {fix_details['Explanation']}",
+                ])
+            else:
+                st.error("❌ AI could not generate a fix for this issue.")
+        else:
+            st.warning(f"⚠️ Failed to retrieve the code from `{file_path}`.")
+
+    # Render the report in memory; there is no need for a temp file on disk.
+    # It is kept with the run so reruns (e.g. the download click itself) don't lay it out again.
+    if report_entries:
+        if "report_pdf" not in results:
+            results["report_pdf"] = build_fix_report(report_entries)
+        st.download_button(
+            "📥 Download Fix Report",
+            data=results["report_pdf"],
+            file_name="Fix_Report.pdf",
+            mime="application/pdf",
+        )
+
+
 st.markdown("**🚀 Built with ❤️ by Ankan Moh, Hanvik S and Sanjay Maj.**")
@@ -0,0 +1,55 @@
+import unittest
+
+from fix_parser import parse_fix_sections
+
+
+class ParseFixSectionsTest(unittest.TestCase):
+    def test_full_reply(self):
+        sections = parse_fix_sections(
+            "Sure!\n\n**Root Cause:** off by one.\n\n"
+            "**Fixed Code:**\n```python\nfor i in range(n):\n    print(i)\n```\n\n"
+            "**Explanation:** fixed the range."
+        )
+        self.assertEqual(sections["Root Cause"], "off by one.")
+        self.assertEqual(sections["Fixed Code"], "for i in range(n):\n    print(i)")
+        self.assertEqual(sections["Explanation"], "fixed the range.")
+
+    def test_prose_after_fence_is_not_code(self):
+        sections = parse_fix_sections(
+            "**Fixed Code:**\n```python\nx = 1\n```\nThis version also handles None.\n\n**Explanation:** e"
+        )
+        self.assertEqual(sections["Fixed Code"], "x = 1")
+        self.assertEqual(sections["Explanation"], "e")
+
+    def test_trailing_text_without_explanation(self):
+        sections = parse_fix_sections("**Fixed Code:**\n```python\nx = 1\n```\n\nHope this helps!")
+        self.assertEqual(sections["Fixed Code"], "x = 1")
+        self.assertEqual(sections["Explanation"], "Not Found")
+
+    def test_only_first_fenced_block(self):
+        sections = parse_fix_sections(
+            "**Fixed Code:**\n```python\nx = 1\n```\nUsage:\n```python\nprint(x)\n```\n**Explanation:** e"
+        )
+        self.assertEqual(sections["Fixed Code"], "x = 1")
+        self.assertEqual(sections["Explanation"], "e")
+
+    def test_unfenced_code(self):
+        sections = parse_fix_sections("**Root Cause:** r\n**Fixed Code:** y = 1\n\n**Explanation:** ok")
+        self.assertEqual(sections["Fixed Code"], "y = 1")
+        self.assertEqual(sections["Explanation"], "ok")
+
+    def test_fence_with_trailing_space_after_language(self):
+        sections = parse_fix_sections("**Fixed Code:**\n```python \nx=1\n```\n**Explanation:** e")
+        self.assertEqual(sections["Fixed Code"], "x=1")
+
+    def test_unclosed_fence_is_not_a_fix(self):
+        sections = parse_fix_sections("**Root Cause:** r\n**Fixed Code:**\n```python\nx=1")
+        self.assertEqual(sections["Fixed Code"], "Not Found")
+
+    def test_missing_sections(self):
+        sections = parse_fix_sections("I could not fix this.")
+        self.assertEqual(set(sections.values()), {"Not Found"})
+
+
+if __name__ == "__main__":
+    unittest.main()